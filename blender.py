@@ -6,34 +6,49 @@
 
 from __future__ import annotations
 
-from typing import *
+from typing import TYPE_CHECKING, NamedTuple, NoReturn, Optional
 
 import asyncio
+import contextlib
+import os
 import subprocess
 import sys
+import time
 import webbrowser
 
-async def aio_run(*args: str, **kw) -> subprocess.CompletedProcess:
+# jeepney is only needed once something turns out to be missing, so it's imported where it's
+# used instead of slowing down every launch.
+if TYPE_CHECKING:
+    from jeepney.io.asyncio import DBusRouter
+
+class RunResult(NamedTuple):
+    """RunResult holds what's left of a finished subprocess."""
+
+    returncode: int
+    stdout: Optional[bytes] = None
+    stderr: Optional[bytes] = None
+
+
+async def aio_run(*args: str, **kw) -> RunResult:
     proc = await asyncio.create_subprocess_exec(*args, **kw)
-    stdout, stderr = await proc.communicate()
-    stdout_res: Optional[str] = None
-    stderr_res: Optional[str] = None
 
-    if stdout is not None:
-        stdout_res = stdout.decode()
-    if stderr is not None:
-        stderr_res = stderr.decode()
+    # Without any pipes there's nothing for communicate() to collect, so skip setting it up.
+    if subprocess.PIPE not in (kw.get('stdin'), kw.get('stdout'), kw.get('stderr')):
+        returncode = await proc.wait()
+        return RunResult(returncode)
+
+    # Output is handed back as bytes, it's up to the caller to decode it if it needs to.
+    stdout, stderr = await proc.communicate()
 
     assert proc.returncode is not None
-    return subprocess.CompletedProcess(args=args, stdout=stdout_res, stderr=stderr_res,
-                                       returncode=proc.returncode)
+    return RunResult(proc.returncode, stdout, stderr)
 
 
 class Flatpak:
     def __init__(self) -> None:
         pass
 
-    async def __call__(self, *args, **kw) -> subprocess.CompletedProcess:
+    async def __call__(self, *args, **kw) -> RunResult:
         return await aio_run('flatpak-spawn', '--host', 'flatpak', *args, **kw)
 
     async def exists(self, ref: str) -> bool:
@@ -41,33 +56,104 @@ class Flatpak:
         return not result.returncode
 
 
+class GnomeSoftware:
+    """GnomeSoftware talks to GNOME Software over the session bus."""
+
+    EXISTS_CACHE_TTL = 300
+
+    def __init__(self, router: DBusRouter) -> None:
+        from jeepney import DBusAddress
+
+        self.router = router
+        self.address = DBusAddress('/org/gnome/Software', bus_name='org.gnome.Software')
+
+    async def _call(self, interface: str, method: str, signature: Optional[str] = None,
+                    body: tuple = ()) -> None:
+        from jeepney import new_method_call
+        from jeepney.wrappers import unwrap_msg
+
+        msg = new_method_call(self.address.with_interface(interface), method, signature, body)
+        unwrap_msg(await self.router.send_and_get_reply(msg))
+
+    async def exists(self) -> bool:
+        # Whether Software is around rarely changes, so the answer is kept for a few minutes.
+        cache_path = os.path.join(os.environ['XDG_RUNTIME_DIR'], 'unityhub.has-gsoftware')
+        try:
+            if time.time() - os.stat(cache_path).st_mtime < self.EXISTS_CACHE_TTL:
+                with open(cache_path, 'rb') as fp:
+                    return fp.read(1) == b'1'
+        except OSError:
+            pass
+
+        from jeepney import DBusErrorResponse
+
+        # Introspecting will also auto-start Software if it's activatable but not running.
+        try:
+            await self._call('org.freedesktop.DBus.Introspectable', 'Introspect')
+        except DBusErrorResponse:
+            exists = False
+        else:
+            exists = True
+
+        # The cache is only an optimization, so failing to write it is fine. Another launch may
+        # be reading it at the same time, so it's replaced in one go rather than rewritten.
+        tmp_path = f'{cache_path}.{os.getpid()}'
+        try:
+            with open(tmp_path, 'wb') as fp:
+                fp.write(b'1' if exists else b'0')
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_path)
+
+        return exists
+
+    async def search(self, ref: str, branch: str) -> None:
+        await self._call('org.gtk.Actions', 'Activate', 'sava{sv}',
+                         ('search', [('s', ref), ('s', branch)], {}))
+
+
 async def not_installed(*, ref: str, title: str, text: str, branch: str,
                         available_on_web: bool) -> None:
-    software_check = await aio_run('gdbus', 'introspect', '-e', '-d', 'org.gnome.Software',
-                                   '-o', '/org/gnome/Software', stdout=subprocess.DEVNULL,
-                                   stderr=subprocess.DEVNULL)
-    has_software = not software_check.returncode
-
-    if has_software or available_on_web:
-        zenity = await aio_run('zenity', '--no-wrap', '--question', f'--title={title}',
-                               f'--text={text}\nWould you like to install it?')
-        if not zenity.returncode:
-            if has_software:
-                await aio_run('gdbus', 'call', '-e', '-d', 'org.gnome.Software', '-o',
-                              '/org/gnome/Software', '-m', 'org.gtk.Actions.Activate', 'search',
-                              f'[<"{ref}">, <"{branch}">]', '[]')
+    async with contextlib.AsyncExitStack() as stack:
+        # Without a usable session bus Software can't be reached, but the user should still be
+        # told what's missing.
+        software: Optional[GnomeSoftware] = None
+        try:
+            from jeepney import DBusErrorResponse
+            from jeepney.io.asyncio import open_dbus_router
+        except ImportError:
+            pass
+        else:
+            try:
+                router = await stack.enter_async_context(open_dbus_router())
+            except (OSError, EOFError, KeyError, ValueError, RuntimeError, asyncio.TimeoutError,
+                    DBusErrorResponse):
+                pass
             else:
-                webbrowser.open(f'https://flathub.org/apps/search/{ref}')
-
-            sys.exit()
-    else:
-        await aio_run('zenity', '--no-wrap', '--warning', f'--title={title}',
-                      f'--text={text}\nPlease install it from Flathub.')
+                software = GnomeSoftware(router)
+
+        has_software = software is not None and await software.exists()
+
+        if has_software or available_on_web:
+            zenity = await aio_run('zenity', '--no-wrap', '--question', f'--title={title}',
+                                   f'--text={text}\nWould you like to install it?')
+            if not zenity.returncode:
+                if software is not None and has_software:
+                    await software.search(ref, branch)
+                else:
+                    webbrowser.open(f'https://flathub.org/apps/search/{ref}')
+
+                sys.exit()
+        else:
+            await aio_run('zenity', '--no-wrap', '--warning', f'--title={title}',
+                          f'--text={text}\nPlease install it from Flathub.')
         
 
-async def spawn_blender(flatpak: Flatpak, ref: str) -> NoReturn:
-    res = await flatpak('run', '--command=blender', ref, *sys.argv[1:])
-    sys.exit(res.returncode)
+def spawn_blender(ref: str) -> NoReturn:
+    # Nothing is left to do once Blender is running, so hand the process over to it entirely.
+    os.execvp('flatpak-spawn', ['flatpak-spawn', '--host', 'flatpak', 'run', '--command=blender',
+                                ref, *sys.argv[1:]])
 
 
 async def main() -> None:
@@ -76,7 +162,7 @@ async def main() -> None:
     ref = 'org.blender.Blender'
     installed = await flatpak.exists(ref)
     if installed:
-        await spawn_blender(flatpak, ref)
+        spawn_blender(ref)
 
     await not_installed(ref='org.blender.Blender', title='Blender is required',
                         text='Blender is required to import Blender model.', branch='',
@@ -1,24 +1,52 @@
 #!/usr/bin/env python3
 
-from xml.etree import ElementTree
-
-import base64
+import contextlib
+import hashlib
 import os
-import subprocess
+import re
 import sys
 
 
-def to_base64(s):
-    return base64.b64encode(s.encode('ascii')).decode('ascii')
+# Unity stores these prefs base64-encoded.
+B64_EDITOR = 'L2FwcC9iaW4vY29kZQ=='  # /app/bin/code
+B64_ARGS = 'JChGaWxlKQ=='  # $(File)
+
+
+@contextlib.contextmanager
+def atomic_write(path, mode='wb', *, durable=False):
+    """Opens a temporary file that replaces path once the block completes successfully.
+
+    If durable is set, the data is also flushed to disk before it replaces the original.
+    """
+    # Another launch may be writing the same file at the same time, so each gets its own.
+    tmp = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp, mode) as fp:
+            yield fp
+
+            if durable:
+                fp.flush()
+                os.fsync(fp.fileno())
 
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
 
-def edit_pref(root, pref, type, func):
-    element = root.find(f'*[@name="{pref}"]')
+        raise
+
+
+def edit_pref(root, by_name, pref, type, func):
+    element = by_name.get(pref)
     if element is None:
-        element = ElementTree.SubElement(root, 'pref', {
+        element = root.makeelement('pref', {
             'type': type,
             'name': pref
         })
+        root.append(element)
+        by_name[pref] = element
 
     new_value = func(element.text)
     if element.text != new_value:
@@ -27,45 +55,132 @@ def edit_pref(root, pref, type, func):
     else:
         return False
 
-def replace_string_pref(root, pref, value):
-    return edit_pref(root, pref, 'string', lambda _: value)
-
-
-def main():
-    prefs = os.path.join(os.environ['XDG_DATA_HOME'], 'unity3d', 'prefs')
-    if not os.path.exists(prefs):
-        os.makedirs(os.path.dirname(prefs), exist_ok=True)
+def replace_string_pref(root, by_name, pref, value):
+    return edit_pref(root, by_name, pref, 'string', lambda _: value)
 
-        with open(prefs, 'w') as fp:
-            print('<unity_prefs version_major="1" version_minor="1">', file=fp)
-            print('</unity_prefs>', file=fp)
 
-    b64_editor = to_base64('/app/bin/code')
-    b64_args = to_base64('$(File)')
+def update_prefs_xml(prefs, string_prefs):
+    # Only pulled in when the prefs don't look like what we expect, so the common launch doesn't
+    # pay for the import. lxml is preferred if it happens to be around, otherwise the stdlib
+    # ElementTree (which transparently uses its C accelerator) is plenty.
+    try:
+        from lxml import etree as ElementTree
+    except ImportError:
+        from xml.etree import ElementTree
 
-    tree = ElementTree.parse(prefs)
-    root = tree.getroot()
+    # Pick out the prefs as they're parsed instead of walking the tree again afterwards. The
+    # whole document is still needed though, since all of it gets written back.
+    events = ElementTree.iterparse(prefs)
+    by_name = {element.get('name'): element for _, element in events if element.tag == 'pref'}
+    root = events.root
 
     was_changed = any([
-        replace_string_pref(root, 'kScriptsDefaultApp', b64_editor),
-        replace_string_pref(root, 'kScriptEditorArgs', b64_args),
-        replace_string_pref(root, 'kScriptEditorArgs/app/bin/code', b64_args),
+        replace_string_pref(root, by_name, pref, value) for pref, value in string_prefs.items()
     ])
 
     if was_changed:
-        tmp = prefs + '.tmp'
-        with open(tmp, 'wb') as fp:
-            tree.write(fp)
+        # Unlike the signature, losing the prefs would lose the user's Unity settings.
+        with atomic_write(prefs, durable=True) as fp:
+            ElementTree.ElementTree(root).write(fp)
+
+
+def string_pref_pattern(pref):
+    name = re.escape(f'name="{pref}"'.encode('ascii'))
+    return re.compile(rb'(<pref\s+(?:type="string"\s+' + name + rb'|' + name +
+                      rb'\s+type="string")\s*>)([^<]*)(</pref>)')
+
+
+def update_prefs(prefs, string_prefs):
+    # The prefs file is a flat list of <pref> elements, so the handful of string prefs we care
+    # about can be patched in place without building a DOM. Anything unexpected (a pref with a
+    # different type or layout, a missing root end tag) is left to update_prefs_xml.
+    with open(prefs, 'rb') as fp:
+        buf = fp.read()
 
-        os.rename(tmp, prefs)
+    # Usually everything is already set up, which plain substring searches can confirm without
+    # running any of the patterns.
+    if all(f'<pref type="string" name="{pref}">{value}</pref>'.encode('ascii') in buf or
+           f'<pref name="{pref}" type="string">{value}</pref>'.encode('ascii') in buf
+           for pref, value in string_prefs.items()):
+        return
 
-    env = os.environ.copy()
-    env['UNITY_DATADIR'] = env['XDG_DATA_HOME']
-    env['TMPDIR'] = f'{env["XDG_CACHE_HOME"]}/tmp'
+    new_buf = buf
+    for pref, value in string_prefs.items():
+        new_buf, count = string_pref_pattern(pref).subn(
+            lambda match: match.group(1) + value.encode('ascii') + match.group(3), new_buf, 1)
+        if count:
+            continue
+
+        end = new_buf.rfind(b'</unity_prefs>')
+        if end == -1 or f'name="{pref}"'.encode('ascii') in new_buf:
+            update_prefs_xml(prefs, string_prefs)
+            return
+
+        element = f'<pref type="string" name="{pref}">{value}</pref>'.encode('ascii')
+        new_buf = new_buf[:end] + element + new_buf[end:]
+
+    if new_buf != buf:
+        with atomic_write(prefs, durable=True) as fp:
+            fp.write(new_buf)
+
+
+def prefs_signature(prefs, *values):
+    # Unity rewrites the prefs file whenever any setting changes, so the file's mtime and size
+    # are part of the signature; otherwise edits made from inside the editor would be missed.
+    st = os.stat(prefs)
+    h = hashlib.blake2b(digest_size=8)
+    for value in values:
+        h.update(value.encode('ascii'))
+        h.update(b'\0')
+    h.update(f'{st.st_mtime_ns}:{st.st_size}'.encode('ascii'))
+    return h.hexdigest()
+
+
+def read_signature(path):
+    try:
+        with open(path) as fp:
+            return fp.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def write_signature(path, sig):
+    with atomic_write(path, 'w') as fp:
+        print(sig, file=fp)
+
+
+def main():
+    prefs = os.path.join(os.environ['XDG_DATA_HOME'], 'unity3d', 'prefs')
+    if not os.path.exists(prefs):
+        os.makedirs(os.path.dirname(prefs), exist_ok=True)
+
+        with open(prefs, 'w') as fp:
+            print('<unity_prefs version_major="1" version_minor="1">', file=fp)
+            print('</unity_prefs>', file=fp)
 
-    os.execvpe('zypak-wrapper',
-               ['zypak-wrapper', '/app/extra/unityhub-bin', *sys.argv[1:]],
-               env)
+    string_prefs = {
+        'kScriptsDefaultApp': B64_EDITOR,
+        'kScriptEditorArgs': B64_ARGS,
+        'kScriptEditorArgs/app/bin/code': B64_ARGS,
+    }
+
+    sig_path = prefs + '.sig'
+    if read_signature(sig_path) != prefs_signature(prefs, *string_prefs.values()):
+        update_prefs(prefs, string_prefs)
+
+        # The signature only saves work on the next launch, so not being able to write it
+        # shouldn't keep Unity Hub from starting.
+        try:
+            write_signature(sig_path, prefs_signature(prefs, *string_prefs.values()))
+        except OSError:
+            pass
+
+    # The process is about to be replaced anyway, so there's no need for a copy of the
+    # environment.
+    os.environ['UNITY_DATADIR'] = os.environ['XDG_DATA_HOME']
+    os.environ['TMPDIR'] = f'{os.environ["XDG_CACHE_HOME"]}/tmp'
+
+    os.execvp('zypak-wrapper', ['zypak-wrapper', '/app/extra/unityhub-bin', *sys.argv[1:]])
 
 
 if __name__ == '__main__':
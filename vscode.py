@@ -21,201 +21,602 @@
 # This is done by finding the first empty socket starting at 56003 at using that to determine
 # a desired PID for a process named "Unity". From inside the VS Code Flatpak, a sleep process
 # is run named "Unity", with the PID of [our socket] - 56000. Therefore, the VS Code extension
-# will find our process and add 56000 to find the socket we want. This script will set up an
-# asyncio-powered forwarding to send it to the *actual* Unity process.
+# will find our process and add 56000 to find the socket we want. This script then forwards the
+# connection to the *actual* Unity process, leaving the copying to the kernel with splice() once
+# both ends are connected.
 
 # Why 56003? Inside the VS Code sandbox, bwrap will be PID 1 and bash PID 2, so the lowest PID
 # the fake Unity sleep process can start as will be 3.
 
 # This script also uses PEP 484 type annotations to try and avoid awkward glitches slipping in.
-# No runtime overhead is incurred, as PEP 563 deferred annotations are used (thanks to the
-# future import), and the typing import is guarded by an 'if False'.
+# The annotations themselves aren't evaluated at runtime, as PEP 563 deferred annotations are
+# used (thanks to the future import), and only the typing names that are needed get imported.
 
 
 from __future__ import annotations
 
-from typing import *
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, NoReturn, Optional, Set, Tuple
 
+import abc
 import asyncio
+import contextlib
+import csv
 import errno
+import io
 import itertools
 import os
+import random
+import socket
 import subprocess
 import sys
+import time
 import traceback
 import webbrowser
 
+# jeepney is only needed once something turns out to be missing, so it's imported where it's
+# used instead of slowing down every launch.
+if TYPE_CHECKING:
+    from jeepney.io.asyncio import DBusRouter
+
 
 VSCODE_SCRIPT = r'''
-target_pid="$1"
-shift
+# This is fed to bash over stdin, so all of it is wrapped in a function: bash reads the whole
+# definition before running any of it, and none of the commands inside get to read the rest of
+# the script as their own stdin.
+main() {
+  target_pid="$1"
+  shift
+
+  # This ends up in an arithmetic context below, so make sure it's just a number.
+  [[ "$target_pid" =~ ^[0-9]+$ ]] || exit 1
+
+  for code in code codium code-oss; do
+    command -v $code >/dev/null && break
+  done
+
+  # This has to be a real copy: /run is a separate tmpfs from the runtime's /usr, so a hard link
+  # can't work, and with a symlink /proc/PID/exe would still point to sleep rather than Unity.
+  cp /usr/bin/sleep /run/Unity
+
+  # Burn through PIDs until the next one is target_pid. A bare subshell only costs a fork, unlike
+  # running /usr/bin/true which would also exec.
+  for (( i=$$; i < $target_pid; i++ )); do ( : ); done
+  /run/Unity infinity &
+
+  [[ -d /usr/lib/sdk/dotnet6 ]] && export PATH="/usr/lib/sdk/dotnet6/bin:$PATH"
+  [[ -d /usr/lib/sdk/mono6 ]] && export PATH="/usr/lib/sdk/mono6/bin:$PATH"
+
+  # Check the settings first, it's much cheaper than starting up the code CLI, and can be done
+  # in bash itself.
+  # Note: don't do grep -q, code --list-extensions doesn't like SIGPIPE
+  settings="$XDG_CONFIG_HOME/Code/User/settings.json"
+  modern_net_disabled='"omnisharp\.useModernNet"[[:space:]]*:[[:space:]]*false'
+  if ! { [[ -r "$settings" ]] && [[ "$(<"$settings")" =~ $modern_net_disabled ]]; } &&
+    $code --list-extensions | grep -F ms-dotnettools.csharp >/dev/null; then
+    zenity --warning --no-wrap --title='omnisharp.useModernNet should be false' \
+      --text="omnisharp.useModernNet should be set to false to avoid errors when started
+from within Unity Editor."
+  fi
+
+  # The CLI hands off to Electron (or an already running instance) and exits right away, so
+  # keep going for as long as the editor itself is around. pidwait blocks until every matching
+  # process is gone, so there's no polling while the editor is open; the check is only repeated
+  # in case a new instance came up in the meantime (or pidwait is missing), and the sleep keeps
+  # that from spinning on processes that have exited but not been reaped yet. -x won't match
+  # anything that merely has "code" in its name.
+  $code "$@"
+  while pgrep -x $code >/dev/null; do
+    pidwait -x $code 2>/dev/null
+    sleep 5
+  done
+  kill $(jobs -p)
+}
+
+main "$@" </dev/null
+'''
 
-code=$(which code codium code-oss 2>/dev/null | head -1)
 
-cp /usr/bin/sleep /run/Unity
+class RunResult(NamedTuple):
+    """RunResult holds what's left of a finished subprocess."""
 
-for (( i=$$; i < $target_pid; i++ )); do /usr/bin/true; done
-/run/Unity infinity &
+    returncode: int
+    stdout: Optional[bytes] = None
+    stderr: Optional[bytes] = None
 
-[[ -d /usr/lib/sdk/dotnet6 ]] && export PATH="/usr/lib/sdk/dotnet6/bin:$PATH"
-[[ -d /usr/lib/sdk/mono6 ]] && export PATH="/usr/lib/sdk/mono6/bin:$PATH"
 
-# Note: don't do grep -q, code --list-extensions doesn't like SIGPIPE
-if $code --list-extensions | grep ms-dotnettools.csharp >/dev/null &&
-  ! grep -qs '"omnisharp\.useModernNet"\s*:\s*false' \
-    $XDG_CONFIG_HOME/Code/User/settings.json; then
-  zenity --warning --no-wrap --title='omnisharp.useModernNet should be false' \
-    --text="omnisharp.useModernNet should be set to false to avoid errors when started
-from within Unity Editor."
-fi
-
-$code "$@"
-while ps -A | grep -q code; do sleep 5; done
-kill $(jobs -p)
-'''
+async def aio_run(*args: str, **kw) -> RunResult:
+    proc = await asyncio.create_subprocess_exec(*args, **kw)
 
+    # Without any pipes there's nothing for communicate() to collect, so skip setting it up.
+    if subprocess.PIPE not in (kw.get('stdin'), kw.get('stdout'), kw.get('stderr')):
+        returncode = await proc.wait()
+        return RunResult(returncode)
 
-async def aio_run(*args: str, **kw) -> subprocess.CompletedProcess:
-    proc = await asyncio.create_subprocess_exec(*args, **kw)
+    # Output is handed back as bytes, it's up to the caller to decode it if it needs to.
     stdout, stderr = await proc.communicate()
-    stdout_res: Optional[str] = None
-    stderr_res: Optional[str] = None
-
-    if stdout is not None:
-        stdout_res = stdout.decode()
-    if stderr is not None:
-        stderr_res = stderr.decode()
 
     assert proc.returncode is not None
-    return subprocess.CompletedProcess(args=args, stdout=stdout_res, stderr=stderr_res,
-                                       returncode=proc.returncode)
+    return RunResult(proc.returncode, stdout, stderr)
 
 
 class Flatpak:
+    """Flatpak runs flatpak commands on the host."""
+
     def __init__(self) -> None:
-        pass
+        self.installed_refs: Optional[Set[str]] = None
+        self.app_runtimes: Optional[Dict[str, str]] = None
 
-    async def __call__(self, *args, **kw) -> subprocess.CompletedProcess:
+    async def __call__(self, *args, **kw) -> RunResult:
         return await aio_run('flatpak-spawn', '--host', 'flatpak', *args, **kw)
 
-    async def get_sdk(self, ref: str) -> Optional[str]:
-        p = await self('info', '--show-sdk', ref, stdout=subprocess.PIPE,
+    async def spawn(self, *args, **kw) -> asyncio.subprocess.Process:
+        """Starts flatpak without waiting for it to finish."""
+        return await asyncio.create_subprocess_exec('flatpak-spawn', '--host', 'flatpak', *args,
+                                                    **kw)
+
+    async def _load_installed(self) -> None:
+        if self.installed_refs is not None:
+            return
+
+        # One listing covers both the apps and the runtimes, so it's loaded once and every
+        # lookup after that is answered from memory.
+        self.installed_refs = set()
+        self.app_runtimes = {}
+
+        p = await self('list', '--columns=ref,runtime', stdout=subprocess.PIPE,
                        stderr=subprocess.DEVNULL)
-        return p.stdout.strip() if not p.returncode else None
+        if p.returncode:
+            return
+
+        assert p.stdout is not None
+        output = io.StringIO(p.stdout.decode())
+        for row in csv.reader(output, delimiter='\t', quoting=csv.QUOTE_NONE):
+            if not row:
+                continue
+
+            ref = row[0]
+            self.installed_refs.add(ref)
+
+            # Apps installed both system-wide and per-user are listed twice, just keep the
+            # first one.
+            if len(row) == 2 and row[1]:
+                self.app_runtimes.setdefault(ref.split('/', 1)[0], row[1])
 
     async def exists(self, ref: str) -> bool:
-        result = await self('info', ref, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        return not result.returncode
+        """Returns whether the given name/arch/branch ref is installed."""
+        await self._load_installed()
+        assert self.installed_refs is not None
+        return ref in self.installed_refs
+
+    async def get_runtime(self, app: str) -> Optional[str]:
+        """Returns the runtime ref used by the given app ID, if it's installed."""
+        await self._load_installed()
+        assert self.app_runtimes is not None
+        return self.app_runtimes.get(app)
+
+
+class GnomeSoftware:
+    """GnomeSoftware talks to GNOME Software over the session bus."""
+
+    EXISTS_CACHE_TTL = 300
+
+    def __init__(self, router: DBusRouter) -> None:
+        from jeepney import DBusAddress
+
+        self.router = router
+        self.address = DBusAddress('/org/gnome/Software', bus_name='org.gnome.Software')
+
+    async def _call(self, interface: str, method: str, signature: Optional[str] = None,
+                    body: tuple = ()) -> None:
+        from jeepney import new_method_call
+        from jeepney.wrappers import unwrap_msg
+
+        msg = new_method_call(self.address.with_interface(interface), method, signature, body)
+        unwrap_msg(await self.router.send_and_get_reply(msg))
+
+    async def exists(self) -> bool:
+        # Whether Software is around rarely changes, so the answer is kept for a few minutes.
+        cache_path = os.path.join(os.environ['XDG_RUNTIME_DIR'], 'unityhub.has-gsoftware')
+        try:
+            if time.time() - os.stat(cache_path).st_mtime < self.EXISTS_CACHE_TTL:
+                with open(cache_path, 'rb') as fp:
+                    return fp.read(1) == b'1'
+        except OSError:
+            pass
+
+        from jeepney import DBusErrorResponse
+
+        # Introspecting will also auto-start Software if it's activatable but not running.
+        try:
+            await self._call('org.freedesktop.DBus.Introspectable', 'Introspect')
+        except DBusErrorResponse:
+            exists = False
+        else:
+            exists = True
+
+        # The cache is only an optimization, so failing to write it is fine. Another launch may
+        # be reading it at the same time, so it's replaced in one go rather than rewritten.
+        tmp_path = f'{cache_path}.{os.getpid()}'
+        try:
+            with open(tmp_path, 'wb') as fp:
+                fp.write(b'1' if exists else b'0')
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_path)
+
+        return exists
+
+    async def search(self, ref: str, branch: str) -> None:
+        await self._call('org.gtk.Actions', 'Activate', 'sava{sv}',
+                         ('search', [('s', ref), ('s', branch)], {}))
 
 
 async def not_installed(*, ref: str, title: str, text: str, branch: str,
                         available_on_web: bool) -> None:
-    software_check = await aio_run('gdbus', 'introspect', '-e', '-d', 'org.gnome.Software',
-                                   '-o', '/org/gnome/Software', stdout=subprocess.DEVNULL,
-                                   stderr=subprocess.DEVNULL)
-    has_software = not software_check.returncode
-
-    if has_software or available_on_web:
-        zenity = await aio_run('zenity', '--no-wrap', '--question', f'--title={title}',
-                               f'--text={text}\nWould you like to install it?')
-        if not zenity.returncode:
-            if has_software:
-                await aio_run('gdbus', 'call', '-e', '-d', 'org.gnome.Software', '-o',
-                              '/org/gnome/Software', '-m', 'org.gtk.Actions.Activate', 'search',
-                              f'[<"{ref}">, <"{branch}">]', '[]')
+    async with contextlib.AsyncExitStack() as stack:
+        # Without a usable session bus Software can't be reached, but the user should still be
+        # told what's missing.
+        software: Optional[GnomeSoftware] = None
+        try:
+            from jeepney import DBusErrorResponse
+            from jeepney.io.asyncio import open_dbus_router
+        except ImportError:
+            pass
+        else:
+            try:
+                router = await stack.enter_async_context(open_dbus_router())
+            except (OSError, EOFError, KeyError, ValueError, RuntimeError, asyncio.TimeoutError,
+                    DBusErrorResponse):
+                pass
             else:
-                webbrowser.open(f'https://flathub.org/apps/search/{ref}')
+                software = GnomeSoftware(router)
+
+        has_software = software is not None and await software.exists()
+
+        if has_software or available_on_web:
+            zenity = await aio_run('zenity', '--no-wrap', '--question', f'--title={title}',
+                                   f'--text={text}\nWould you like to install it?')
+            if not zenity.returncode:
+                if software is not None and has_software:
+                    await software.search(ref, branch)
+                else:
+                    webbrowser.open(f'https://flathub.org/apps/search/{ref}')
+
+                sys.exit()
+        else:
+            await aio_run('zenity', '--no-wrap', '--warning', f'--title={title}',
+                          f'--text={text}\nPlease install it from Flathub.')
+
+
+class ForwardingProtocol(asyncio.BufferedProtocol, metaclass=abc.ABCMeta):
+    """ForwardingProtocol receives into a reusable buffer and passes each chunk to forward()."""
+
+    __slots__ = ('recv_buffer',)
+
+    BUFFER_SIZE = 64 * 1024
+
+    def __init__(self) -> None:
+        self.recv_buffer = bytearray(self.BUFFER_SIZE)
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        if sizehint > len(self.recv_buffer):
+            self.recv_buffer = bytearray(sizehint)
+        return memoryview(self.recv_buffer)
+
+    def buffer_updated(self, nbytes: int) -> None:
+        with memoryview(self.recv_buffer) as view:
+            self.forward(view[:nbytes])
 
-            sys.exit()
-    else:
-        await aio_run('zenity', '--no-wrap', '--warning', f'--title={title}',
-                      f'--text={text}\nPlease install it from Flathub.')
+    @abc.abstractmethod
+    def forward(self, data: memoryview) -> None:
+        """Passes on a chunk that was just received, which points into the receive buffer."""
 
+    def write_to(self, transport: asyncio.Transport, data: memoryview) -> None:
+        transport.write(data)
 
-class UnityBridge(asyncio.Protocol):
+        # If not everything could be sent right away, the transport may hang on to the data
+        # without copying it, so the buffer can't be received into again.
+        if transport.get_write_buffer_size():
+            self.recv_buffer = bytearray(self.BUFFER_SIZE)
+
+
+class UnityBridge(ForwardingProtocol):
     """UnityBridge represents the connection from this script to Unity."""
 
+    __slots__ = ('vscode_transport',)
+
     def __init__(self, vscode_transport: asyncio.BaseTransport) -> None:
+        super().__init__()
         assert isinstance(vscode_transport, asyncio.Transport)
         self.vscode_transport = vscode_transport
 
-    def data_received(self, data: bytes) -> None:
-        self.vscode_transport.write(data)
+    def forward(self, data: memoryview) -> None:
+        self.write_to(self.vscode_transport, data)
 
     def connection_lost(self, exc: Optional[Exception]) -> None:
         self.vscode_transport.close()
 
 
-class VscodeBridge(asyncio.Protocol):
+class VscodeBridge(ForwardingProtocol):
     """VscodeBridge represents the connection from VS Code to this script."""
 
+    __slots__ = ('unity_port', 'transport', 'unity_transport', 'buffer', 'reading_paused')
+
+    # Stop reading from VS Code once this much is waiting for Unity to come up.
+    MAX_PENDING = 16 * 1024 * 1024
+
+    INITIAL_RETRY_DELAY = 0.1
+    MAX_RETRY_DELAY = 5.0
+
     def __init__(self, unity_port: int) -> None:
+        super().__init__()
         self.unity_port = unity_port
+        self.transport: Optional[asyncio.Transport] = None
         self.unity_transport: Optional[asyncio.Transport] = None
         self.buffer = bytearray()
+        self.reading_paused = False
 
     def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        assert isinstance(transport, asyncio.Transport)
+        self.transport = transport
+
+        # Debugger messages are small and latency-sensitive, so make sure Nagle's algorithm
+        # never holds them back, rather than relying on the event loop to have done it.
+        sock = transport.get_extra_info('socket')
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
         asyncio.create_task(self.try_connect(transport))
 
     async def try_connect(self, transport: asyncio.BaseTransport) -> None:
         loop = asyncio.get_running_loop()
+        delay = self.INITIAL_RETRY_DELAY
 
         while True:
-            # Try connecting to Unity.
+            # Try connecting to Unity. The socket is connected by hand to skip resolving
+            # 'localhost' again on every single attempt. TCP_NODELAY is set here as well, since
+            # when splicing the socket never gets wrapped in a transport that would set it.
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setblocking(False)
             try:
-                unity_transport: asyncio.BaseTransport
-                unity_transport, _ = await loop.create_connection(  # type: ignore
-                    lambda: UnityBridge(transport), 'localhost', self.unity_port)
+                await loop.sock_connect(sock, ('127.0.0.1', self.unity_port))
             except OSError:
-                # Likely a connection failure.
-                print('Error connecting to Unity, will retry after 5s...')
+                sock.close()
+                # Likely a connection failure. Unity may just still be starting up, so retry
+                # soon at first and then back off.
+                print(f'Error connecting to Unity, will retry after {delay:.1f}s...')
                 traceback.print_exc()
-                await asyncio.sleep(5)
+                await asyncio.sleep(delay + random.uniform(0, delay * 0.1))
+                delay = min(delay * 2, self.MAX_RETRY_DELAY)
             else:
+                if hasattr(os, 'splice'):
+                    await self.splice_to(sock)
+                    break
+
+                unity_transport: asyncio.BaseTransport
+                unity_transport, _ = await loop.create_connection(  # type: ignore
+                    lambda: UnityBridge(transport), sock=sock)
                 assert isinstance(unity_transport, asyncio.Transport)
                 self.unity_transport = unity_transport
 
+                # Hand the buffer over as a whole rather than clearing it after the write, since
+                # the transport is allowed to keep referring to it instead of copying.
                 if self.buffer:
                     unity_transport.write(self.buffer)
-                    self.buffer.clear()
+                    self.buffer = bytearray()
+
+                if self.reading_paused:
+                    assert self.transport is not None
+                    self.reading_paused = False
+                    self.transport.resume_reading()
 
                 break
 
-    def data_received(self, data: bytes) -> None:
+    async def splice_to(self, unity_sock: socket.socket) -> None:
+        loop = asyncio.get_running_loop()
+        assert self.transport is not None
+
+        # Anything VS Code sent while waiting still has to go through userspace. More may
+        # arrive while it's being sent, so keep going until it's all out.
+        try:
+            while self.buffer:
+                buffer, self.buffer = self.buffer, bytearray()
+                await loop.sock_sendall(unity_sock, buffer)
+        except OSError:
+            # Unity went away already, so there's nothing left to bridge.
+            traceback.print_exc()
+            unity_sock.close()
+            self.transport.close()
+            return
+
+        if self.transport.is_closing():
+            unity_sock.close()
+            return
+
+        # From here on the data never has to leave the kernel, so take VS Code's socket away
+        # from its transport. Nothing has been written to VS Code yet, so the transport has
+        # nothing left to flush, and aborting it only closes its own copy of the socket.
+        vscode_sock = self.transport.get_extra_info('socket')
+        vscode_sock = socket.fromfd(vscode_sock.fileno(), vscode_sock.family, vscode_sock.type)
+        vscode_sock.setblocking(False)
+        self.transport.abort()
+
+        SocketSplice(vscode_sock, unity_sock)
+
+    def forward(self, data: memoryview) -> None:
         if self.unity_transport is not None:
-            self.unity_transport.write(data)
+            self.write_to(self.unity_transport, data)
         else:
             self.buffer.extend(data)
 
+            if len(self.buffer) >= self.MAX_PENDING and not self.reading_paused:
+                assert self.transport is not None
+                self.reading_paused = True
+                self.transport.pause_reading()
+
     def connection_lost(self, exc: Optional[Exception]) -> None:
         if self.unity_transport is not None:
             self.unity_transport.close()
             self.unity_transport = None
 
 
+class SplicePump:
+    """SplicePump moves everything from one socket to another through a pipe with splice()."""
+
+    __slots__ = ('loop', 'splice', 'src', 'dst', 'pipe_r', 'pipe_w', 'pending', 'stopped')
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, splice: SocketSplice, src: socket.socket, dst: socket.socket) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.splice = splice
+        self.src = src
+        self.dst = dst
+        self.pipe_r, self.pipe_w = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+        self.pending = 0
+        self.stopped = False
+
+        self.loop.add_reader(self.src.fileno(), self.on_readable)
+
+    def on_readable(self) -> None:
+        try:
+            n = os.splice(self.src.fileno(), self.pipe_w, self.CHUNK_SIZE,
+                          flags=os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK)
+        except BlockingIOError:
+            return
+        except OSError:
+            self.splice.close()
+            return
+
+        if not n:
+            self.splice.shutdown()
+            return
+
+        self.pending += n
+        self.flush()
+
+    def on_writable(self) -> None:
+        self.loop.remove_writer(self.dst.fileno())
+        if not self.stopped:
+            self.loop.add_reader(self.src.fileno(), self.on_readable)
+
+        self.flush()
+
+    def flush(self) -> None:
+        while self.pending:
+            try:
+                n = os.splice(self.pipe_r, self.dst.fileno(), self.pending,
+                              flags=os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK)
+            except BlockingIOError:
+                # The other side isn't keeping up, so stop reading until it has room again.
+                self.loop.remove_reader(self.src.fileno())
+                self.loop.add_writer(self.dst.fileno(), self.on_writable)
+                return
+            except OSError:
+                self.splice.close()
+                return
+
+            self.pending -= n
+
+        if self.stopped:
+            self.splice.shutdown()
+
+    def stop_reading(self) -> None:
+        self.stopped = True
+        self.loop.remove_reader(self.src.fileno())
+
+    def close(self) -> None:
+        self.loop.remove_reader(self.src.fileno())
+        self.loop.remove_writer(self.dst.fileno())
+        os.close(self.pipe_r)
+        os.close(self.pipe_w)
+
+
+class SocketSplice:
+    """SocketSplice forwards between two connected sockets without copying into userspace."""
+
+    __slots__ = ('socks', 'closed', 'pumps')
+
+    def __init__(self, a: socket.socket, b: socket.socket) -> None:
+        self.socks = a, b
+        self.closed = False
+        self.pumps = SplicePump(self, a, b), SplicePump(self, b, a)
+
+    def shutdown(self) -> None:
+        """Closes both sockets once whatever was already read has been passed on."""
+        if self.closed:
+            return
+
+        # Like with the transports, one side hanging up ends the whole connection. Anything
+        # still sitting in a pipe gets written out first, the way transport.close() would.
+        for pump in self.pumps:
+            pump.stop_reading()
+
+        if not any(pump.pending for pump in self.pumps):
+            self.close()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+
+        self.closed = True
+        for pump in self.pumps:
+            pump.close()
+        for sock in self.socks:
+            sock.close()
+
+
 async def forward_unity_socket(unity_port: int) -> Tuple[int, asyncio.AbstractServer]:
     loop = asyncio.get_running_loop()
 
+    # Binding to port 0 would be cheaper, but the port has to be as close to 56003 as possible,
+    # since every port above it means another PID for VSCODE_SCRIPT to burn through. A port
+    # that's taken only costs one failed bind(), which is less than finding out from the
+    # kernel's socket tables up front.
+    #
+    # Probe with plain bind() calls on one socket, rather than setting up (and tearing down) a
+    # whole server for every port that turns out to be taken. The protocol is spelled out since
+    # asyncio only turns on TCP_NODELAY for accepted sockets whose proto is IPPROTO_TCP.
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
     for target_pid in itertools.count(3):
         target_port = 56000 + target_pid
-
         try:
-            server: asyncio.AbstractServer
-            server = await loop.create_server(lambda: VscodeBridge(unity_port),  # type: ignore
-                                              'localhost', target_port)
+            sock.bind(('127.0.0.1', target_port))
         except OSError as ex:
             if ex.errno == errno.EADDRINUSE:
                 continue
             else:
+                sock.close()
                 raise
         else:
-            return target_pid, server
+            break
+
+    sock.listen()
+    sock.setblocking(False)
 
-    assert False
+    server: asyncio.AbstractServer
+    server = await loop.create_server(lambda: VscodeBridge(unity_port),  # type: ignore
+                                      sock=sock)
+    return target_pid, server
 
 
-async def spawn_vscode(flatpak: Flatpak, ref: str, sdk: str, unity_port: int) -> NoReturn:
-    sdk_arch_branch = sdk.split('/', 1)[1]
+def pin_to_one_cpu() -> None:
+    # All this process does for most of its life is shuttle small debugger messages back and
+    # forth, which is quicker if it isn't moved between CPUs (and their caches) in between.
+    # Which CPU is picked by PID, so that several bridges don't all pile onto the same one.
+    if not hasattr(os, 'sched_setaffinity'):
+        return
+
+    cpus = sorted(os.sched_getaffinity(0))
+    os.sched_setaffinity(0, {cpus[os.getpid() % len(cpus)]})
+
+
+async def spawn_vscode(flatpak: Flatpak, ref: str, runtime: str, unity_port: int) -> NoReturn:
+    # The SDK always shares its arch and branch with the runtime.
+    sdk_arch_branch = runtime.split('/', 1)[1]
 
     missing_sdk_extension_refs: List[str] = []
     for sdk_ext in 'dotnet6', 'mono6':
@@ -236,10 +637,17 @@ async def spawn_vscode(flatpak: Flatpak, ref: str, sdk: str, unity_port: int) ->
                             branch=sdk_arch_branch.split('/')[-1], available_on_web=False)
 
     target_pid, transport = await forward_unity_socket(unity_port)
-    res = await flatpak('run', '--command=bash', ref, '-c', VSCODE_SCRIPT, '--', str(target_pid),
-                        *sys.argv[1:])
+    # The script goes in over stdin rather than as an argument, so it doesn't have to be copied
+    # through every layer of flatpak-spawn, flatpak and bwrap along with the rest of the argv.
+    proc = await flatpak.spawn('run', '--command=bash', ref, '-s', '--', str(target_pid),
+                               *sys.argv[1:], stdin=subprocess.PIPE)
+
+    # Nothing else gets spawned from here on, so only the bridge itself ends up pinned.
+    pin_to_one_cpu()
+
+    await proc.communicate(VSCODE_SCRIPT.encode())
     transport.close()
-    sys.exit(res.returncode)
+    sys.exit(proc.returncode)
 
 
 async def main() -> None:
@@ -247,11 +655,10 @@ async def main() -> None:
     unity_port = unity_pid % 1000 + 56000
 
     flatpak = Flatpak()
-
     for ref in 'com.visualstudio.code-oss', 'com.visualstudio.code', 'com.vscodium.codium':
-        sdk = await flatpak.get_sdk(ref)
-        if sdk is not None:
-            await spawn_vscode(flatpak, ref, sdk, unity_port)
+        runtime = await flatpak.get_runtime(ref)
+        if runtime is not None:
+            await spawn_vscode(flatpak, ref, runtime, unity_port)
 
     await not_installed(ref='com.visualstudio.code', title='Visual Studio Code is required',
                         text='Visual Studio Code is required to edit Unity scripts.', branch='',